@@ -1,15 +1,67 @@
 #!/usr/bin/env python3.11
+"""
+Clones openQA jobs or posts ISOs as described by YAML config files, collecting the URLs of the new jobs.
+
+Loaded config documents are cached in memory and shared: load_configs() hands out copies of each
+document mapping and of its 'variables' mapping only, while lists and other nested values are the
+cached objects themselves. Code working on configs must therefore treat nested values as read-only
+and build new containers (as partition_variables() and expand_variables() do) instead of mutating them.
+"""
+import functools
 import json
 import itertools
+import logging
+import os
+import shlex
+import shutil
 import yaml
 import subprocess
+import tempfile
 import re
 import sys
 import argparse
+import errno
+import stat
+import zlib
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import IO, List, Dict, Any, Callable, Iterable, Iterator, Tuple
 
-class UniqueKeyLoader(yaml.SafeLoader):
+# Errors, warnings and dry-run notices; main() sends them to stdout alongside the progress output
+log = logging.getLogger("clone_runner")
+
+# Upper bound on concurrently running openqa-clone-job / openqa-cli processes
+MAX_WORKERS = 32
+
+# Parsed configs are stored here as JSON, keyed by config path and invalidated when its mtime or size changes
+CONFIG_CACHE_DIR = Path(os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache') / 'openqa-clone-runner'
+
+# Part of every cache key; bump it whenever parsing changes what a config file yields, so older entries are ignored
+CONFIG_CACHE_VERSION = 2
+
+# Identifies a parse result: (CONFIG_CACHE_VERSION, parser ('yaml' or 'json'), mtime_ns, size)
+CacheKey = Tuple[int, str, int, int]
+
+# Configs already loaded by this process, by path: (cache key, docs), least recently used first
+CONFIG_MEMORY_CACHE: OrderedDict[str, Tuple[CacheKey, List[Dict[str, Any]]]] = OrderedDict()
+CONFIG_MEMORY_CACHE_SIZE = 100
+
+# An arrow followed by whitespace and the URL of a new job, as printed by openqa-clone-job;
+# a single C-level findall beats any scan written with Python string methods
+URL_RE = re.compile(r"->\s+(https?://\S+)")
+
+# Matches a %VAR% reference inside a variable value; names can't start with a digit,
+# which str.format would treat as a positional field
+VAR_RE = re.compile(r'%((?!\d)\w+)%')
+
+# Prefer the libyaml C bindings, falling back to the pure-Python loader when PyYAML was built without them
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+class UniqueKeyLoader(SafeLoader):
     def construct_mapping(self, node, deep=False):
         mapping = set()
         for key_node, value_node in node.value:
@@ -19,164 +71,507 @@ class UniqueKeyLoader(yaml.SafeLoader):
             mapping.add(key)
         return super().construct_mapping(node, deep)
 
-def load_configs(config_path: Path) -> List[Dict[str, Any]]:
+def config_cache_file(config_path: str) -> Path:
+    """Returns the cache file for the parsed documents of a config file, given its resolved path."""
+    # Only a file name: the entry itself records the path, so a checksum collision is a mere cache miss
+    return CONFIG_CACHE_DIR / f"{zlib.crc32(config_path.encode('utf-8')):08x}.json"
+
+def read_config_cache(config_path: Path, cache_key: CacheKey) -> List[Dict[str, Any]] | None:
+    """Returns the cached documents of a config file, or None if there are none for this cache key."""
+    path = str(config_path.resolve())
+    try:
+        with open(config_cache_file(path), encoding='utf-8') as file:
+            entry = json.load(file)
+    except (OSError, ValueError):  # a missing, truncated or otherwise corrupt cache file is simply a miss
+        return None
+    if not isinstance(entry, dict) or entry.get('path') != path or entry.get('key') != list(cache_key):
+        return None
+    return entry.get('docs')
+
+def write_config_cache(config_path: Path, cache_key: CacheKey, docs: List[Dict[str, Any]]) -> None:
+    """
+    Stores the parsed documents of a config file as JSON, which unlike pickle cannot run code when read back.
+    Documents JSON cannot reproduce exactly (dates, sets, non-string keys, ...) are not cached; failing to
+    write the cache is not an error either.
+    """
+    path = str(config_path.resolve())
+    try:
+        text = json.dumps({'path': path, 'key': list(cache_key), 'docs': docs})
+        if json.loads(text)['docs'] != docs:
+            return
+        CONFIG_CACHE_DIR.mkdir(mode=0o700, parents=True, exist_ok=True)
+        with open(config_cache_file(path), 'w', encoding='utf-8') as file:
+            file.write(text)
+    except (OSError, TypeError, ValueError):
+        pass
+
+def copy_configs(docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Returns copies of the documents and their 'variables' mappings; deeper values stay shared with the cache.
+    Variable names are interned, so lookups against the (equally interned) %VAR% references compare by identity.
+    """
+    copies = []
+    for doc in docs:
+        if isinstance(doc, dict):
+            doc = dict(doc)
+            if isinstance(doc.get('variables'), dict):
+                doc['variables'] = {sys.intern(key) if type(key) is str else key: value
+                                    for key, value in doc['variables'].items()}
+        copies.append(doc)
+    return copies
+
+def remember_configs(memory_key: str, cache_key: CacheKey, docs: List[Dict[str, Any]]) -> None:
+    """Keeps freshly loaded documents in the in-process cache, evicting the oldest entry when full."""
+    CONFIG_MEMORY_CACHE[memory_key] = (cache_key, docs)
+    CONFIG_MEMORY_CACHE.move_to_end(memory_key)
+    if len(CONFIG_MEMORY_CACHE) > CONFIG_MEMORY_CACHE_SIZE:
+        CONFIG_MEMORY_CACHE.popitem(last=False)
+
+def open_regular(path: Path) -> Tuple[IO[str], os.stat_result]:
+    """
+    Opens a regular file for reading and returns it together with its stat result.
+    A single open() + fstat() replaces a separate is_file() check followed by open().
+    Raises FileNotFoundError if the path does not exist or is not a regular file.
+    """
+    # O_NONBLOCK keeps open() from hanging on a FIFO; it has no effect on regular files
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+    except OSError as e:
+        # A path through a regular file or a symlink loop doesn't name a file either, as for Path.is_file()
+        if e.errno in (errno.ENOTDIR, errno.ELOOP):
+            raise FileNotFoundError(errno.ENOENT, os.strerror(e.errno), str(path)) from e
+        raise
     try:
-        with config_path.open('r', encoding='utf-8') as file:
-            return [doc for doc in yaml.load_all(file, Loader=UniqueKeyLoader) if doc is not None]
+        file_stat = os.fstat(fd)
+        if not stat.S_ISREG(file_stat.st_mode):
+            raise FileNotFoundError(errno.ENOENT, "Not a regular file", str(path))
+        return os.fdopen(fd, 'r', encoding='utf-8'), file_stat
+    except BaseException:
+        os.close(fd)
+        raise
+
+def parse_configs(source: str | IO[str], config_path: Path | str = '<string>') -> List[Dict[str, Any]]:
+    """Parses the YAML documents of a config given as text or an open stream, skipping empty ones."""
+    try:
+        return [doc for doc in yaml.load_all(source, Loader=UniqueKeyLoader) if doc is not None]
     except (yaml.YAMLError, ValueError) as e:
         raise ValueError(f"Error parsing YAML file '{config_path}': {e}") from e
 
+def unique_json_object(pairs: List[Tuple[str, Any]]) -> Dict[str, Any]:
+    """object_pairs_hook rejecting duplicate keys, which json would otherwise silently overwrite."""
+    mapping = {}
+    for key, value in pairs:
+        if key in mapping:
+            raise ValueError(f"Duplicate key '{key}' found in JSON")
+        mapping[key] = value
+    return mapping
+
+def yaml_scalar(text: str) -> Any:
+    """Resolves a JSON number or constant the way the YAML loader does, e.g. '1e3' stays a string and 'NaN' too."""
+    return yaml.load(text, Loader=SafeLoader)
+
+def parse_json_config(source: str | IO[str], config_path: Path | str = '<string>') -> List[Dict[str, Any]]:
+    """
+    Parses a config written as JSON, which is much faster than going through the YAML loader.
+    JSON is valid YAML, and the result is the single document the YAML loader would produce: integers and
+    strings agree anyway, while floats and constants (rare in configs) are resolved by the YAML loader itself.
+    """
+    try:
+        doc = json.loads(source if isinstance(source, str) else source.read(), object_pairs_hook=unique_json_object,
+                         parse_float=yaml_scalar, parse_constant=yaml_scalar)
+    except ValueError as e:  # includes json.JSONDecodeError
+        raise ValueError(f"Error parsing JSON file '{config_path}': {e}") from e
+    return [doc] if doc is not None else []
+
+def load_configs(config_path: Path) -> List[Dict[str, Any]]:
+    file, file_stat = open_regular(config_path)
+    with file:
+        parser = 'json' if config_path.suffix == '.json' else 'yaml'
+        cache_key = (CONFIG_CACHE_VERSION, parser, file_stat.st_mtime_ns, file_stat.st_size)
+        memory_key = str(config_path)
+        cached = CONFIG_MEMORY_CACHE.get(memory_key)
+        if cached is not None and cached[0] == cache_key:
+            CONFIG_MEMORY_CACHE.move_to_end(memory_key)
+            return copy_configs(cached[1])
+
+        docs = read_config_cache(config_path, cache_key)
+        if docs is not None:
+            remember_configs(memory_key, cache_key, docs)
+            return copy_configs(docs)
+
+        if parser == 'json':
+            docs = parse_json_config(file, config_path)
+        else:
+            docs = parse_configs(file, config_path)
+
+    write_config_cache(config_path, cache_key, docs)
+    remember_configs(memory_key, cache_key, docs)
+    return copy_configs(docs)
+
 def extract_urls(output_text: str) -> List[str]:
     """Parses output looking for: '- jobname -> https://url...' """
-    url_pattern = re.compile(r"->\s+(https?://\S+)")
-    return url_pattern.findall(output_text)
+    return URL_RE.findall(output_text)
 
 def validate_variables(variables: Dict[str, Any]) -> None:
     if not variables:
         return
     for key, value in variables.items():
-        if key != key.upper():
+        # isupper() accepts typical keys without allocating; only keys without cased
+        # characters (e.g. '_1') fall back to the exact comparison
+        if not key.isupper() and key != key.upper():
             raise ValueError(f"Error: Variable '{key}' must be uppercase.")
-        if isinstance(value, str) and not value:
+        if value == '':
             raise ValueError(f"Error: Variable '{key}' cannot be an empty string.")
-        if isinstance(value, list):
-            if any(isinstance(item, str) and not item for item in value):
-                raise ValueError(f"Error: Variable '{key}' contains an empty string in the list.")
+        if type(value) is list and '' in value:
+            raise ValueError(f"Error: Variable '{key}' contains an empty string in the list.")
+
+class ExpandedVariables(dict):
+    """Variables mapping for str.format_map that leaves references to undefined variables as %VAR%."""
+
+    def __missing__(self, key: str) -> str:
+        return f"%{key}%"
+
+@functools.lru_cache(maxsize=1024)
+def compile_template(value: str) -> Tuple[str, frozenset]:
+    """
+    Converts a value with %VAR% references into a str.format_map template ('%VAR%' -> '{VAR}',
+    literal braces escaped) and returns it with the set of referenced variable names.
+    Cached, as the same values are expanded again for every ISO post combination.
+    """
+    escaped = value.replace('{', '{{').replace('}', '}}')
+    return VAR_RE.sub(r'{\1}', escaped), frozenset(map(sys.intern, VAR_RE.findall(value)))
 
 def expand_variables(variables: Dict[str, Any]) -> Dict[str, Any]:
     """
-    Iteratively expands variables referencing other variables (e.g. %VAR%).
-    Returns a new dictionary with expanded values.
+    Expands variables referencing other variables (e.g. %VAR%).
+    Values are substituted exactly once, in dependency order; variables caught in a
+    circular reference are left unexpanded, and references to them are kept as %VAR%.
+    Returns a new dictionary with expanded values, or the input itself when no value contains a '%'.
     """
-    expanded_vars = variables.copy()
-    limit_hit = True
-    for _ in range(5):
-        changes = 0
-        for key, val in expanded_vars.items():
-            if isinstance(val, str) and '%' in val:
-                new_val = re.sub(r'%(\w+)%', lambda m: str(expanded_vars.get(m.group(1), m.group(0))), val)
-                if new_val != val:
-                    expanded_vars[key] = new_val
-                    changes += 1
-        if changes == 0:
-            limit_hit = False
-            break
-
-    if limit_hit:
-        print("Warning: Variable expansion hit the iteration limit (5). Circular dependency or deep nesting detected.")
-
-    # Check for undefined variables remaining in values
-    for key, val in expanded_vars.items():
-        if isinstance(val, str) and '%' in val:
-            for var_name in set(re.findall(r'%(\w+)%', val)):
+    candidates = [key for key, val in variables.items() if isinstance(val, str) and '%' in val]
+    if not candidates:
+        return variables
+
+    expanded_vars = ExpandedVariables(variables)
+    # For every value that needs expansion, the referenced variables that need expansion themselves
+    pending = {key: set(compile_template(expanded_vars[key])[1]) for key in candidates}
+    dependents = defaultdict(list)
+    for key, refs in pending.items():
+        refs.intersection_update(pending)
+        for ref in refs:
+            dependents[ref].append(key)
+
+    def expand_in_order(ready: deque, mapping: ExpandedVariables) -> None:
+        # Kahn's algorithm: expand a value once all the values it references are final
+        while ready:
+            key = ready.popleft()
+            del pending[key]
+            mapping[key] = compile_template(mapping[key])[0].format_map(mapping)
+            for dependent in dependents[key]:
+                if dependent in pending:
+                    pending[dependent].discard(key)
+                    if not pending[dependent]:
+                        ready.append(dependent)
+
+    expand_in_order(deque(key for key, refs in pending.items() if not refs), expanded_vars)
+
+    if pending:
+        # What is left references a cycle; only the variables reaching themselves are part of one
+        cyclic = cyclic_variables(pending)
+        log.warning("Warning: Circular variable reference detected involving: %s.", ', '.join(sorted(cyclic)))
+
+        # Expand the values that merely depend on a cycle, with the cycle members' references left as %VAR%
+        for key in cyclic:
+            del pending[key]
+        for refs in pending.values():
+            refs.difference_update(cyclic)
+        acyclic = ExpandedVariables({key: val for key, val in expanded_vars.items() if key not in cyclic})
+        expand_in_order(deque(key for key, refs in pending.items() if not refs), acyclic)
+        expanded_vars.update(acyclic)
+
+    # Check for undefined variables remaining in values; only values that contained a '%' can reference any
+    for key in candidates:
+        val = expanded_vars[key]
+        if '%' in val:
+            for var_name in compile_template(val)[1]:
                 if var_name not in expanded_vars:
-                    print(f"Warning: Variable '%{var_name}%' referenced in '{key}' is not defined.")
+                    log.warning("Warning: Variable '%%%s%%' referenced in '%s' is not defined.", var_name, key)
 
-    return expanded_vars
-
-def execute_command(command: List[str], dry_run: bool, error_context: str) -> str | None:
-    """Executes a subprocess command, handling dry-run and errors."""
-    if dry_run:
-        print(f"[DRY RUN] Would execute: {' '.join(command)}")
-        return None
+    # ExpandedVariables only serves format_map; callers get a plain dict raising KeyError for unknown names
+    return dict(expanded_vars)
 
+def cyclic_variables(references: Dict[str, set]) -> set:
+    """
+    Returns the variables that are part of a reference cycle, given each variable's references.
+    Tarjan's strongly connected components algorithm, iterative so long chains can't hit the recursion limit;
+    a component is a cycle if it has several members or its single member references itself.
+    """
+    index: Dict[str, int] = {}
+    lowlink: Dict[str, int] = {}
+    stack: List[str] = []
+    on_stack = set()
+    cyclic = set()
+    for root in references:
+        if root in index:
+            continue
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(references[root]))]
+        while work:
+            key, refs = work[-1]
+            for ref in refs:
+                if ref not in index:
+                    index[ref] = lowlink[ref] = len(index)
+                    stack.append(ref)
+                    on_stack.add(ref)
+                    work.append((ref, iter(references[ref])))
+                    break
+                if ref in on_stack:
+                    lowlink[key] = min(lowlink[key], index[ref])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[key])
+                if lowlink[key] == index[key]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == key:
+                            break
+                    if len(component) > 1 or key in references[key]:
+                        cyclic.update(component)
+    return cyclic
+
+@functools.lru_cache(maxsize=None)
+def resolve_executable(name: str) -> str:
+    """Returns the absolute path of an executable found in PATH, or the name itself if it is not found."""
+    return shutil.which(name) or name
+
+def parse_clone_output(stream: IO[bytes]) -> Tuple[str, List[str]]:
+    """
+    Scans openqa-clone-job output line by line as it is produced.
+    Returns the decoded output, so it can be shown once the job is reported, and the new job URLs.
+    """
+    lines = []
+    urls = []
+    for raw_line in stream:
+        line = raw_line.decode('utf-8', 'replace')
+        lines.append(line)
+        urls.extend(extract_urls(line))
+    return ''.join(lines), urls
+
+def parse_iso_output(stream: IO[bytes]) -> Dict[str, Any] | None:
+    """Decodes the JSON response of 'openqa-cli api -X post isos', or returns None if it is not valid JSON."""
     try:
-        result = subprocess.run(command, check=True, text=True, capture_output=True)
-        print(result.stdout)
-        return result.stdout
-    except subprocess.CalledProcessError as e:
-        print(f"Error executing {error_context}")
-        print(e.stderr)
+        # json.loads takes the raw bytes as well and detects their UTF encoding
+        return json.loads(stream.read())
+    except (json.JSONDecodeError, UnicodeDecodeError):
         return None
 
+def execute_streaming(command: List[str], parse: Callable[[IO[bytes]], Any]) -> Tuple[int, Any, str]:
+    """
+    Executes a subprocess command, feeding its stdout pipe directly to parse instead of
+    buffering it, and returns (returncode, parsed stdout, stderr).
+    An absolute executable and close_fds=False (pipes created by Python are non-inheritable
+    anyway) keep subprocess on its posix_spawn fast path instead of fork+exec.
+    """
+    # stderr goes to a temporary file so a chatty command can't block on a full pipe while we read stdout
+    with tempfile.TemporaryFile() as stderr, \
+            subprocess.Popen(command, executable=resolve_executable(command[0]), close_fds=False,
+                             stdout=subprocess.PIPE, stderr=stderr) as proc:
+        parsed = parse(proc.stdout)
+        # Drain whatever the parser left unread so the child never blocks on a full pipe
+        proc.stdout.read()
+        returncode = proc.wait()
+        stderr.seek(0)
+        return returncode, parsed, stderr.read().decode('utf-8', 'replace')
+
+def execute_commands(commands: Iterable[List[str]], parse: Callable[[IO[bytes]], Any],
+                     dry_run: bool) -> Iterator[Tuple[List[str], Tuple[int, Any, str] | None]]:
+    """
+    Executes commands concurrently in a thread pool, yielding (command, result) in submission order.
+    Commands are pulled lazily and at most MAX_WORKERS of them are in flight at any time.
+    In dry-run mode nothing is executed and the result is None for every command.
+    """
+    if dry_run:
+        for command in commands:
+            yield command, None
+        return
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        in_flight = deque()
+        for command in commands:
+            in_flight.append((command, executor.submit(execute_streaming, command, parse)))
+            if len(in_flight) >= MAX_WORKERS:
+                command, future = in_flight.popleft()
+                yield command, future.result()
+        while in_flight:
+            command, future = in_flight.popleft()
+            yield command, future.result()
+
+class ShellCommand:
+    """An argv rendered as a shell command line only when the log record holding it is formatted."""
+    __slots__ = ('argv',)
+
+    def __init__(self, argv: List[str]) -> None:
+        self.argv = argv
+
+    def __str__(self) -> str:
+        return shlex.join(self.argv)
+
+def report_result(command: List[str], result: Tuple[int, Any, str] | None, error_context: str) -> bool:
+    """Logs the dry-run notice or the error of a failed command; returns True if the command succeeded."""
+    if result is None:
+        # Quoted so the line can be pasted into a shell; the record also carries the argv itself
+        log.info("[DRY RUN] Would execute: %s", ShellCommand(command), extra={'command': command})
+        return False
+
+    returncode, _, stderr = result
+    if returncode != 0:
+        log.error("Error executing %s\n%s", error_context, stderr)
+        return False
+    return True
+
 def run_clone_jobs(jobs_to_clone: List[str], flags: List[str], variables: Dict[str, Any], dry_run: bool) -> List[str]:
-    new_urls = []
-    for job_url in jobs_to_clone:
-        command = ["openqa-clone-job", "--within-instance", job_url] + flags
-        # Add variables
-        for key, value in variables.items():
-            if value is not None:
-                command.append(f"{key}={value}")
+    # The variable assignments are the same for every job, so build them once
+    variable_args = [f"{key}={value}" for key, value in variables.items() if value is not None]
+    commands = (["openqa-clone-job", "--within-instance", job_url, *flags, *variable_args] for job_url in jobs_to_clone)
 
+    # Insertion-ordered dict used as an ordered set: the same job can be reported more than once
+    new_urls: Dict[str, None] = {}
+    for job_url, (command, result) in zip(jobs_to_clone, execute_commands(commands, parse_clone_output, dry_run)):
         print(f"\nProcessing: {job_url}")
 
-        output = execute_command(command, dry_run, f"clone for {job_url}")
-        if output:
-            extracted = extract_urls(output)
+        if report_result(command, result, f"clone for {job_url}"):
+            # Printed here rather than while the job runs, so the output of concurrent jobs is not interleaved
+            output, extracted = result[1]
+            print(output)
             if extracted:
                 print(f"   Extracted {len(extracted)} new job URLs.")
-                new_urls.extend(extracted)
+                for url in extracted:
+                    print(f"   -> {url}")
+                new_urls.update(dict.fromkeys(extracted))
             else:
                 print("   No new job URLs found in output.")
-    return new_urls
+    return list(new_urls)
+
+def partition_variables(variables: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, List[Any]]]:
+    """
+    Splits variables into scalars and lists (to be expanded into combinations) in a single pass,
+    dropping unset (None) values. Exact type checks suffice for values coming from YAML.
+    """
+    scalars = {}
+    lists = {}
+    for key, value in variables.items():
+        if type(value) is list:
+            lists[key] = value
+        elif value is not None:
+            scalars[key] = value
+    return scalars, lists
+
+def resolve_host(host: str | None, flags: List[str]) -> str:
+    """Returns the openQA host job URLs are built for, exiting if it conflicts with --osd/--o3."""
+    flag_set = set(flags)
+    has_osd = '--osd' in flag_set
+    has_o3 = '--o3' in flag_set
+    if host:
+        if has_osd and 'suse.de' not in host:
+            log.error("Error: Conflicting options: 'host' set to '%s' but '--osd' flag provided.", host)
+            sys.exit(1)
+        if has_o3 and 'opensuse.org' not in host:
+            log.error("Error: Conflicting options: 'host' set to '%s' but '--o3' flag provided.", host)
+            sys.exit(1)
+    elif has_o3 and not has_osd:
+        host = 'https://openqa.opensuse.org'
+    else:
+        host = 'https://openqa.suse.de'
+    return host.rstrip('/')
 
 def run_iso_post(config: Dict[str, Any], flags: List[str], dry_run: bool) -> List[str]:
     required_vars = ['DISTRI', 'VERSION', 'FLAVOR', 'ARCH', '_GROUP_ID', 'ISO']
     variables = config.get('variables') or {}
     missing = [var for var in required_vars if var not in variables]
     if missing:
-        print(f"Error: Missing required variables for ISO post: {', '.join(missing)}")
+        log.error("Error: Missing required variables for ISO post: %s", ', '.join(missing))
         sys.exit(1)
 
-    # Separate scalar variables and list variables for expansion
-    scalars = {}
-    lists = {}
-    for k, v in variables.items():
-        if isinstance(v, list):
-            lists[k] = v
-        elif v is not None:
-            scalars[k] = v
+    scalars, lists = partition_variables(variables)
 
-    # Generate all combinations of list variables
+    # Lazily generate all combinations of list variables (a single empty one if there are none)
     list_keys = list(lists.keys())
-    list_values = list(lists.values())
-    combinations = list(itertools.product(*list_values)) if list_values else [()]
+    combinations = itertools.product(*lists.values())
 
-    all_new_urls = []
+    all_new_urls: Dict[str, None] = {}
 
     # Determine host for URL construction once
-    host = config.get('host')
-    if host:
-        if '--osd' in flags and 'suse.de' not in host:
-            print(f"Error: Conflicting options: 'host' set to '{host}' but '--osd' flag provided.")
-            sys.exit(1)
-        if '--o3' in flags and 'opensuse.org' not in host:
-            print(f"Error: Conflicting options: 'host' set to '{host}' but '--o3' flag provided.")
-            sys.exit(1)
-    else:
-        host = 'https://openqa.suse.de'
-        if '--osd' in flags:
-            host = 'https://openqa.suse.de'
-        elif '--o3' in flags:
-            host = 'https://openqa.opensuse.org'
-    host = host.rstrip('/')
-
-    for combo in combinations:
-        # Merge scalars with current combination
-        current_vars = scalars.copy()
-        for i, key in enumerate(list_keys):
-            current_vars[key] = combo[i]
-
-        current_vars = expand_variables(current_vars)
-
-        # Construct command
-        command = ["openqa-cli", "api", "-X", "post", "isos"] + flags
-        for key, value in current_vars.items():
-            command.append(f"{key}={value}")
-
-        output = execute_command(command, dry_run, "ISO post command")
-        if output:
-            try:
-                data = json.loads(output)
-                job_ids = data.get('ids', [])
-
-                if job_ids:
-                    print(f"   Extracted {len(job_ids)} new job IDs.")
-                    all_new_urls.extend([f"{host}/t{jid}" for jid in job_ids])
-            except json.JSONDecodeError:
-                print("   Warning: Output was not valid JSON. Could not extract job IDs.")
-
-    return all_new_urls
+    host = resolve_host(config.get('host'), flags)
+
+    base_command = ["openqa-cli", "api", "-X", "post", "isos", *flags]
+
+    # Without any '%' in the scalars or list items no combination can need expansion, so don't check each one
+    needs_expansion = any(isinstance(value, str) and '%' in value
+                          for value in itertools.chain(scalars.values(), *lists.values()))
+
+    def build_commands() -> Iterator[List[str]]:
+        for combo in combinations:
+            # Merge scalars with current combination
+            current_vars = scalars | dict(zip(list_keys, combo))
+            if needs_expansion:
+                current_vars = expand_variables(current_vars)
+
+            yield base_command + [f"{key}={value}" for key, value in current_vars.items()]
+
+    for command, result in execute_commands(build_commands(), parse_iso_output, dry_run):
+        if report_result(command, result, "ISO post command"):
+            data = result[1]
+            if data is None:
+                log.warning("   Warning: Output was not valid JSON. Could not extract job IDs.")
+                continue
+
+            # Show openQA's answer as the output of the command used to be shown; it also lists
+            # the job templates that could not be scheduled
+            print(f"   Response: {json.dumps(data)}")
+            failed = data.get('failed')
+            if failed:
+                log.warning("   Warning: %d job(s) could not be scheduled: %s", len(failed), json.dumps(failed))
+
+            job_ids = data.get('ids', [])
+            if job_ids:
+                print(f"   Extracted {len(job_ids)} new job IDs.")
+                all_new_urls.update(dict.fromkeys(f"{host}/t{jid}" for jid in job_ids))
+
+    return list(all_new_urls)
+
+class StdoutHandler(logging.StreamHandler):
+    """
+    Writes log records to whatever sys.stdout is at the time, so they keep their place among print() output.
+    Records are not flushed one by one: stdout stays block-buffered when piped, e.g. for long dry-run listings.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(sys.stdout)
+
+    @property
+    def stream(self) -> IO[str]:
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value: IO[str]) -> None:
+        pass
+
+    def flush(self) -> None:
+        pass
+
+def configure_logging() -> None:
+    """Sends the plain log messages to stdout; safe to call more than once."""
+    if not any(isinstance(handler, StdoutHandler) for handler in log.handlers):
+        log.addHandler(StdoutHandler())
+    log.setLevel(logging.INFO)
+    log.propagate = False
 
 def print_help_page() -> None:
     print("""OpenQA Clone Automator
@@ -225,6 +620,7 @@ Options:
 """)
 
 def main() -> None:
+    configure_logging()
     parser = argparse.ArgumentParser(description="OpenQA Clone Automator", add_help=False)
     parser.add_argument("-h", "--help", action="store_true", help="Show this help message and exit")
     parser.add_argument("config_files", type=Path, nargs='*', help="Path to YAML config file(s)")
@@ -239,21 +635,20 @@ def main() -> None:
 
     # Warn if -o is used with multiple inputs, as we will ignore it or it's ambiguous
     if args.output and len(args.config_files) > 1:
-        print("Warning: --output flag is ignored when multiple configuration files are provided. "
-              "Output files will be named based on input files.")
+        log.warning("Warning: --output flag is ignored when multiple configuration files are provided. "
+                    "Output files will be named based on input files.")
 
     for config_path in args.config_files:
-        if not config_path.is_file():
-            print(f"Error: Config file '{config_path}' not found.")
-            sys.exit(1)
-
         try:
             configs = load_configs(config_path)
+        except FileNotFoundError:
+            log.error("Error: Config file '%s' not found.", config_path)
+            sys.exit(1)
         except ValueError as e:
-            print(e)
+            log.error("%s", e)
             sys.exit(1)
 
-        current_file_urls = []
+        current_file_urls: Dict[str, None] = {}
         for i, config in enumerate(configs):
             variables = config.get('variables', {})
             validate_variables(variables)
@@ -271,14 +666,12 @@ def main() -> None:
                 new_urls = run_iso_post(config, flags, args.dry_run)
 
             if new_urls:
-                current_file_urls.extend(new_urls)
+                current_file_urls.update(dict.fromkeys(new_urls))
 
         if not args.dry_run and current_file_urls:
             output_file = args.output if (args.output and len(args.config_files) == 1) else config_path.with_name(f"{config_path.stem}.urls.txt")
             print("\n" + "="*40)
-            with output_file.open("w", encoding="utf-8") as f:
-                for url in current_file_urls:
-                    f.write(url + "\n")
+            output_file.write_bytes(("\n".join(current_file_urls) + "\n").encode("utf-8"))
             print(f"Success! {len(current_file_urls)} URLs saved to '{output_file}'")
             print(f"You can now run: openqa-mon -i {output_file}")
             print("="*40)
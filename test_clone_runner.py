@@ -1,10 +1,72 @@
 #!/usr/bin/env python3
 import unittest
+from contextlib import contextmanager, redirect_stdout
 from unittest.mock import patch, MagicMock
-from io import StringIO
+from io import BytesIO, StringIO
+import json
+import logging
+import re
+import shlex
 import sys
+import tempfile
+import yaml
+from pathlib import Path
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Iterator
 import clone_runner
 
+# Minimal valid ISO post variables, shared read-only by the ISO mode tests;
+# tests needing other variables derive a copy with {**_BASE_ISO_VARS, ...}
+_BASE_ISO_VARS = MappingProxyType({
+    'DISTRI': 'sle', 'VERSION': '15-SP5', 'FLAVOR': 'Online',
+    'ARCH': 'x86_64', '_GROUP_ID': 100, 'ISO': 'dummy.iso'
+})
+
+# The summary main() prints for every output file written, capturing the URL count and file name
+SUCCESS_RE = re.compile(r"^Success! (\d+) URLs saved to '([^']*)'$", re.MULTILINE)
+
+def fake_process(mock_popen: MagicMock, stdout: bytes = b'', returncode: int = 0) -> None:
+    """Configures a patched subprocess.Popen so every spawned process prints stdout and exits with returncode."""
+    def spawn(*args, **kwargs):
+        proc = MagicMock(stdout=BytesIO(stdout))
+        proc.__enter__.return_value = proc
+        proc.wait.return_value = returncode
+        return proc
+    mock_popen.side_effect = spawn
+
+def run_main(*argv: str) -> None:
+    """Runs clone_runner.main() with the given command line arguments."""
+    with patch('sys.argv', ['clone_runner.py', *argv]):
+        clone_runner.main()
+
+class ExitCalled(BaseException):
+    """
+    Raised by the sys.exit replacement installed by exit_catcher(). Like SystemExit it derives from
+    BaseException, so 'except Exception' handlers in the code under test cannot swallow it.
+    """
+
+class ExitStatus:
+    """The status passed to sys.exit inside an exit_catcher() block; None if it was not called."""
+    code: int | None = None
+
+@contextmanager
+def exit_catcher() -> Iterator[ExitStatus]:
+    """Turns sys.exit() into an ExitCalled exception that ends the block and records the exit status."""
+    def fake_exit(code: int | None = 0) -> None:
+        raise ExitCalled(code)
+
+    status = ExitStatus()
+    try:
+        with patch('sys.exit', fake_exit):
+            yield status
+    except ExitCalled as e:
+        status.code = e.args[0]
+
+def dry_run_commands(records: list[logging.LogRecord]) -> list[list[str]]:
+    """Returns the argv of every command announced by a dry-run notice among the captured log records."""
+    return [record.command for record in records if hasattr(record, 'command')]
+
 class TestValidateVariables(unittest.TestCase):
 
     def test_valid_variables(self):
@@ -33,6 +95,12 @@ class TestValidateVariables(unittest.TestCase):
 
         self.assertEqual(str(cm.exception), "Error: Variable 'arch' must be uppercase.")
 
+    def test_keys_without_letters(self):
+        """Test that keys without any cased character are accepted as uppercase."""
+        clone_runner.validate_variables({'_1': 'x', '_GROUP_ID': 100})
+        with self.assertRaises(ValueError):
+            clone_runner.validate_variables({'_group_id': 100})
+
     def test_empty_string_value(self):
         """Test that an empty string value triggers an error."""
         variables = {'ARCH': ''}
@@ -72,6 +140,177 @@ class TestValidateVariables(unittest.TestCase):
         except ValueError:
             self.fail("validate_variables() raised ValueError unexpectedly with list of non-strings!")
 
+class TestLoadConfigs(unittest.TestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_path = Path(tmp_dir.name)
+        self.enterContext(patch('clone_runner.CONFIG_CACHE_DIR', self.tmp_path / 'cache'))
+        self.enterContext(patch('clone_runner.CONFIG_MEMORY_CACHE', OrderedDict()))
+
+    def test_cached_configs_skip_parsing(self):
+        """Test that an unchanged config file is served from the cache instead of being parsed again."""
+        config = self.tmp_path / 'config.yaml'
+        config.write_text("variables:\n  ARCH: x86_64\n")
+        first = clone_runner.load_configs(config)
+        clone_runner.CONFIG_MEMORY_CACHE.clear()  # as in a new process, only the on-disk cache is left
+        with patch('yaml.load_all') as mock_load_all:
+            second = clone_runner.load_configs(config)
+        mock_load_all.assert_not_called()
+        self.assertEqual(first, second)
+        self.assertEqual(second, [{'variables': {'ARCH': 'x86_64'}}])
+
+    def test_disk_cache_invalidated_by_version_and_corruption(self):
+        """Test that cache entries from another cache version or corrupt cache files are ignored."""
+        config = self.tmp_path / 'config.yaml'
+        config.write_text("variables:\n  ARCH: x86_64\n")
+        clone_runner.load_configs(config)
+        for invalidate in (lambda: self.enterContext(patch('clone_runner.CONFIG_CACHE_VERSION', -1)),
+                           lambda: clone_runner.config_cache_file(str(config.resolve())).write_bytes(b'\x80\x05garbage')):
+            with self.subTest(invalidate=invalidate):
+                clone_runner.CONFIG_MEMORY_CACHE.clear()
+                invalidate()
+                with patch('yaml.load_all', wraps=yaml.load_all) as mock_load_all:
+                    docs = clone_runner.load_configs(config)
+                mock_load_all.assert_called_once()
+                self.assertEqual(docs, [{'variables': {'ARCH': 'x86_64'}}])
+
+    def test_disk_cache_is_private_json(self):
+        """Test that the cache directory is private and that documents JSON can't reproduce are not cached."""
+        config = self.tmp_path / 'config.yaml'
+        config.write_text("variables:\n  ARCH: x86_64\n")
+        clone_runner.load_configs(config)
+        cache_file = clone_runner.config_cache_file(str(config.resolve()))
+        self.assertEqual(json.loads(cache_file.read_text())['docs'], [{'variables': {'ARCH': 'x86_64'}}])
+        self.assertEqual(clone_runner.CONFIG_CACHE_DIR.stat().st_mode & 0o777, 0o700)
+
+        dated = self.tmp_path / 'dated.yaml'
+        dated.write_text("variables:\n  BUILD: 2024-01-31\n")
+        clone_runner.load_configs(dated)
+        self.assertFalse(clone_runner.config_cache_file(str(dated.resolve())).exists())
+
+    def test_memory_cache_returns_copies(self):
+        """Test that repeated loads in one process skip the disk cache and cannot alter each other's documents."""
+        config = self.tmp_path / 'config.yaml'
+        config.write_text("variables:\n  ARCH: x86_64\n")
+        first = clone_runner.load_configs(config)
+        first[0]['variables']['ARCH'] = 'changed'
+        first[0]['host'] = 'https://changed'
+        with patch('clone_runner.read_config_cache') as mock_read_cache:
+            docs = clone_runner.load_configs(config)
+        mock_read_cache.assert_not_called()
+        self.assertEqual(docs, [{'variables': {'ARCH': 'x86_64'}}])
+
+    def test_variable_names_are_interned(self):
+        """Test that loaded variable names are the interned strings the %VAR% references resolve to."""
+        config = self.tmp_path / 'config.yaml'
+        config.write_text("variables:\n  SOME_LONG_VARIABLE_NAME: x\n")
+        (key,) = clone_runner.load_configs(config)[0]['variables']
+        (ref,) = clone_runner.compile_template('%SOME_LONG_VARIABLE_NAME%')[1]
+        self.assertIs(key, ref)
+
+    def test_memory_cache_evicts_least_recently_used(self):
+        """Test that the in-process cache holds at most CONFIG_MEMORY_CACHE_SIZE files."""
+        self.enterContext(patch('clone_runner.CONFIG_MEMORY_CACHE_SIZE', 2))
+        configs = [self.tmp_path / f'config{i}.yaml' for i in range(3)]
+        for config in configs:
+            config.write_text("variables: {}\n")
+            clone_runner.load_configs(config)
+        self.assertEqual(list(clone_runner.CONFIG_MEMORY_CACHE), [str(configs[1]), str(configs[2])])
+
+    def test_modified_config_is_reparsed(self):
+        """Test that changing the config file invalidates its cached documents."""
+        config = self.tmp_path / 'config.yaml'
+        config.write_text("variables:\n  ARCH: x86_64\n")
+        clone_runner.load_configs(config)
+        config.write_text("variables:\n  ARCH: aarch64\n")
+        self.assertEqual(clone_runner.load_configs(config), [{'variables': {'ARCH': 'aarch64'}}])
+
+    def test_duplicate_keys_yaml(self):
+        """Test that duplicate keys in YAML raise a ValueError naming the key and line."""
+        with self.assertRaises(ValueError) as cm:
+            clone_runner.parse_configs("variables:\n  ARCH: x86_64\n  ARCH: i586", 'duplicate.yaml')
+        self.assertIn("Error parsing YAML file 'duplicate.yaml': Duplicate key 'ARCH' found in YAML at line 3", str(cm.exception))
+
+    def test_json_config_skips_yaml_loader(self):
+        """Test that a .json config is parsed as JSON, as a single document like the YAML loader would."""
+        config = self.tmp_path / 'config.json'
+        config.write_text('{"jobs_to_clone": ["https://example.com/t1"], "variables": {"ARCH": "x86_64"}}')
+        with patch('yaml.load_all') as mock_load_all:
+            docs = clone_runner.load_configs(config)
+        mock_load_all.assert_not_called()
+        self.assertEqual(docs, [{'jobs_to_clone': ['https://example.com/t1'], 'variables': {'ARCH': 'x86_64'}}])
+
+    def test_json_config_matches_yaml_loader(self):
+        """Test that numbers and constants in a JSON config resolve exactly as the YAML loader resolves them."""
+        text = ('{"variables": {"BUILD": 1e3, "A": 1.0e+3, "B": 1.5, "C": 1E+3, "D": NaN, "E": -7, '
+                '"F": true, "G": null, "H": "1e3", "I": [0.5, 2]}}')
+        self.assertEqual(clone_runner.parse_json_config(text), clone_runner.parse_configs(text))
+        self.assertEqual(clone_runner.parse_json_config(text)[0]['variables']['BUILD'], '1e3')
+
+    def test_json_config_errors(self):
+        """Test that invalid JSON and duplicate keys are reported like YAML errors."""
+        for text, error in [('{"variables": ', "Expecting value"),
+                            ('{"variables": {"ARCH": "x86_64", "ARCH": "i586"}}', "Duplicate key 'ARCH' found in JSON")]:
+            with self.subTest(text=text), self.assertRaises(ValueError) as cm:
+                clone_runner.parse_json_config(text, 'config.json')
+            self.assertIn(f"Error parsing JSON file 'config.json': {error}", str(cm.exception))
+
+    def test_parse_configs_from_text(self):
+        """Test that YAML text is parsed without touching the filesystem, skipping empty documents."""
+        self.assertEqual(clone_runner.parse_configs("---\nhost: a\n---\n---\nhost: b\n"), [{'host': 'a'}, {'host': 'b'}])
+
+    @unittest.skipUnless(hasattr(yaml, 'CSafeLoader'), "PyYAML built without libyaml")
+    def test_uses_libyaml_loader(self):
+        """Test that configs are parsed with the libyaml C loader when PyYAML provides it."""
+        config = self.tmp_path / 'config.yaml'
+        config.write_text("variables:\n  ARCH: x86_64\n")
+        with patch('yaml.load_all', wraps=yaml.load_all) as mock_load_all:
+            clone_runner.load_configs(config)
+        loader = mock_load_all.call_args.kwargs['Loader']
+        self.assertTrue(issubclass(loader, yaml.CSafeLoader))
+
+class TestPartitionVariables(unittest.TestCase):
+
+    def test_partition(self):
+        """Test that variables are split into scalars and lists, dropping unset values."""
+        scalars, lists = clone_runner.partition_variables({'ARCH': ['x86_64', 'aarch64'], 'BUILD': 1, 'ISO': 'a.iso', 'UNSET': None})
+        self.assertEqual(scalars, {'BUILD': 1, 'ISO': 'a.iso'})
+        self.assertEqual(lists, {'ARCH': ['x86_64', 'aarch64']})
+
+class TestResolveHost(unittest.TestCase):
+
+    def test_default_hosts(self):
+        """Test that the host defaults to OSD unless only --o3 is given."""
+        self.assertEqual(clone_runner.resolve_host(None, []), 'https://openqa.suse.de')
+        self.assertEqual(clone_runner.resolve_host(None, ['--osd']), 'https://openqa.suse.de')
+        self.assertEqual(clone_runner.resolve_host(None, ['--o3']), 'https://openqa.opensuse.org')
+
+    def test_configured_host(self):
+        """Test that a configured host is used without its trailing slash."""
+        self.assertEqual(clone_runner.resolve_host('https://openqa.opensuse.org/', ['--o3']), 'https://openqa.opensuse.org')
+
+class TestExtractUrls(unittest.TestCase):
+
+    def test_extracts_job_urls(self):
+        """Test that URLs following the arrow marker are extracted from every line."""
+        output = ("Cloning parents of sle-15-Online-x86_64-Build1-foo@64bit\n"
+                  " - sle-15-Online-x86_64-Build1-foo@64bit -> https://openqa.example.com/tests/42\n"
+                  "Created job #43: sle-15-bar ->\thttp://openqa.example.com/tests/43 (parent)\n")
+        self.assertEqual(clone_runner.extract_urls(output),
+                         ['https://openqa.example.com/tests/42', 'http://openqa.example.com/tests/43'])
+
+    def test_ignores_lines_without_url(self):
+        """Test that arrows not followed by whitespace and an http(s) URL are ignored."""
+        output = "a -> not-a-url\nb ->https://openqa.example.com/tests/1\nno marker here\nc -> https://\n"
+        self.assertEqual(clone_runner.extract_urls(output), [])
+
+    def test_arrows_around_and_inside_urls(self):
+        """Test that a URL containing '->' is kept whole and that every arrow on a line is considered."""
+        self.assertEqual(clone_runner.extract_urls("x -> https://h/a->b"), ['https://h/a->b'])
+        self.assertEqual(clone_runner.extract_urls("a -> ftp://x -> https://y -> http://z"), ['https://y', 'http://z'])
+
 class TestExpandVariables(unittest.TestCase):
 
     def test_simple_expansion(self):
@@ -86,266 +325,327 @@ class TestExpandVariables(unittest.TestCase):
         expanded = clone_runner.expand_variables(variables)
         self.assertEqual(expanded['C'], 'start-mid-end')
 
-    @patch('sys.stdout', new_callable=StringIO)
-    def test_undefined_variable_warning(self, mock_stdout: StringIO):
+    def test_literal_braces_and_non_string_values(self):
+        """Test that literal braces survive expansion and non-string values are rendered with str()."""
+        variables = {'GROUP': 100, 'ENABLED': True, 'DESC': '{%GROUP%}-%ENABLED%-{}'}
+        expanded = clone_runner.expand_variables(variables)
+        self.assertEqual(expanded['DESC'], '{100}-True-{}')
+
+    def test_no_references_short_circuit(self):
+        """Test that variables without any '%' are returned as-is without scanning."""
+        variables = {'ARCH': 'x86_64', 'BUILD': 123}
+        self.assertIs(clone_runner.expand_variables(variables), variables)
+
+    def test_undefined_variable_warning(self):
         """Test that a warning is printed for undefined variables."""
         variables = {'ISO': 'SLES-%MISSING%.iso'}
-        expanded = clone_runner.expand_variables(variables)
-        self.assertIn("Warning: Variable '%MISSING%' referenced in 'ISO' is not defined.", mock_stdout.getvalue())
+        with self.assertLogs('clone_runner', 'WARNING') as cm:
+            expanded = clone_runner.expand_variables(variables)
+        self.assertEqual([record.getMessage() for record in cm.records],
+                         ["Warning: Variable '%MISSING%' referenced in 'ISO' is not defined."])
         self.assertEqual(expanded['ISO'], 'SLES-%MISSING%.iso')
+        self.assertIs(type(expanded), dict)
+        with self.assertRaises(KeyError):
+            expanded['MISSING']
 
-    @patch('sys.stdout', new_callable=StringIO)
-    def test_circular_dependency_limit(self, mock_stdout: StringIO):
+    def test_circular_dependency_limit(self):
         """Test that circular dependencies do not cause an infinite loop."""
         variables = {'A': 'recurse-%A%'}
-        expanded = clone_runner.expand_variables(variables)
+        with self.assertLogs('clone_runner', 'WARNING') as cm:
+            expanded = clone_runner.expand_variables(variables)
         # Should finish without hanging; values remain unexpanded
         self.assertIn('%A%', expanded['A'])
-        self.assertIn("Warning: Variable expansion hit the iteration limit (5).", mock_stdout.getvalue())
-
-class TestCloneRunnerCLI(unittest.TestCase):
+        self.assertEqual(cm.records[0].getMessage(), "Warning: Circular variable reference detected involving: A.")
+
+    def test_circular_dependency_members(self):
+        """Test that only the variables caught in a cycle are reported and left unexpanded."""
+        variables = {'A': '%B%', 'B': '%A%', 'C': 'ok', 'D': '%C%-%C%', 'E': '%C%-%A%', 'F': '%E%!'}
+        with self.assertLogs('clone_runner', 'WARNING') as cm:
+            expanded = clone_runner.expand_variables(variables)
+        self.assertEqual(expanded['D'], 'ok-ok')
+        self.assertEqual((expanded['A'], expanded['B']), ('%B%', '%A%'))
+        # Values depending on a cycle still get their other references expanded
+        self.assertEqual((expanded['E'], expanded['F']), ('ok-%A%', 'ok-%A%!'))
+        self.assertEqual([record.getMessage() for record in cm.records],
+                         ["Warning: Circular variable reference detected involving: A, B."])
+
+    def test_cyclic_variables(self):
+        """Test that only members of reference cycles are found, not the variables merely depending on them."""
+        references = {'A': {'B'}, 'B': {'A'}, 'S': {'S'}, 'X': {'A', 'S'}, 'Y': {'X'}, 'Z': set()}
+        self.assertEqual(clone_runner.cyclic_variables(references), {'A', 'B', 'S'})
+
+class TestExecuteCommands(unittest.TestCase):
+
+    def test_dry_run_executes_nothing(self):
+        """Test that dry-run yields a placeholder per command without spawning processes."""
+        mock_subprocess = self.enterContext(patch('subprocess.Popen'))
+        results = list(clone_runner.execute_commands([['a'], ['b']], clone_runner.parse_clone_output, dry_run=True))
+        self.assertEqual(results, [(['a'], None), (['b'], None)])
+        mock_subprocess.assert_not_called()
 
-    @patch('sys.stdout', new_callable=StringIO)
-    def test_missing_config_file(self, mock_stdout: StringIO):
+    def test_dry_run_command_is_shell_quoted(self):
+        """Test that the dry-run notice quotes arguments so it can be pasted into a shell."""
+        with self.assertLogs('clone_runner', 'INFO') as cm:
+            self.assertFalse(clone_runner.report_result(['openqa-cli', 'DESC=two words'], None, 'ctx'))
+        self.assertEqual(cm.records[0].getMessage(), "[DRY RUN] Would execute: openqa-cli 'DESC=two words'")
+        self.assertEqual(shlex.split(cm.records[0].getMessage().partition(': ')[2]), cm.records[0].command)
+
+    def test_dry_run_notice_formatted_lazily(self):
+        """Test that the dry-run command line is only rendered when the notice is actually logged."""
+        with patch.object(clone_runner.log, 'disabled', True), patch('shlex.join') as mock_join:
+            clone_runner.report_result(['openqa-cli', 'api'], None, 'ctx')
+        mock_join.assert_not_called()
+
+    def test_results_in_submission_order(self):
+        """Test that concurrent execution preserves the order of the submitted commands."""
+        mock_execute = self.enterContext(patch('clone_runner.execute_streaming'))
+        mock_execute.side_effect = lambda command, parse: (0, command[0], '')
+        commands = [[f"cmd{i}"] for i in range(50)]
+        results = list(clone_runner.execute_commands(iter(commands), clone_runner.parse_clone_output, dry_run=False))
+        self.assertEqual([command for command, _ in results], commands)
+        self.assertEqual([parsed for _, (_, parsed, _) in results], [c[0] for c in commands])
+
+    def test_bounded_in_flight_commands(self):
+        """Test that commands are pulled lazily, never more than MAX_WORKERS ahead of the results."""
+        mock_execute = self.enterContext(patch('clone_runner.execute_streaming'))
+        mock_execute.return_value = (0, None, '')
+        pulled = []
+
+        def commands():
+            for i in range(3 * clone_runner.MAX_WORKERS):
+                pulled.append(i)
+                yield [f"cmd{i}"]
+
+        results = clone_runner.execute_commands(commands(), clone_runner.parse_clone_output, dry_run=False)
+        next(results)
+        self.assertEqual(len(pulled), clone_runner.MAX_WORKERS)
+        results.close()
+
+    def test_posix_spawn_friendly_arguments(self):
+        """Test that commands are launched with an absolute executable and without closing fds."""
+        self.enterContext(patch('shutil.which', return_value='/usr/bin/openqa-cli'))
+        mock_subprocess = self.enterContext(patch('subprocess.Popen'))
+        clone_runner.resolve_executable.cache_clear()
+        self.addCleanup(clone_runner.resolve_executable.cache_clear)
+        fake_process(mock_subprocess)
+        clone_runner.execute_streaming(['openqa-cli', 'api'], clone_runner.parse_iso_output)
+        kwargs = mock_subprocess.call_args.kwargs
+        self.assertEqual(kwargs['executable'], '/usr/bin/openqa-cli')
+        self.assertFalse(kwargs['close_fds'])
+
+    def test_streaming_parsers(self):
+        """Test that stdout is parsed straight from the pipe for both clone and ISO post output."""
+        mock_subprocess = self.enterContext(patch('subprocess.Popen'))
+        fake_process(mock_subprocess, b"Created job #1: foo -> https://new/t1\nnoise\n - bar -> https://new/t2\n")
+        self.assertEqual(clone_runner.execute_streaming(['openqa-clone-job'], clone_runner.parse_clone_output),
+                         (0, ("Created job #1: foo -> https://new/t1\nnoise\n - bar -> https://new/t2\n",
+                              ['https://new/t1', 'https://new/t2']), ''))
+
+        fake_process(mock_subprocess, b'{"ids": [7, 8]}', returncode=0)
+        self.assertEqual(clone_runner.execute_streaming(['openqa-cli'], clone_runner.parse_iso_output)[1], {'ids': [7, 8]})
+
+        fake_process(mock_subprocess, b'not json', returncode=0)
+        self.assertIsNone(clone_runner.execute_streaming(['openqa-cli'], clone_runner.parse_iso_output)[1])
+
+class CLITestCase(unittest.TestCase):
+    """Base class for tests driving main() with captured stdout."""
+
+    @classmethod
+    def setUpClass(cls):
+        # One capture buffer per class, emptied before each test
+        cls.stdout = StringIO()
+
+    def setUp(self):
+        self.stdout.seek(0)
+        self.stdout.truncate()
+        self.enterContext(redirect_stdout(self.stdout))
+
+    def assertExitsWithError(self, argv: tuple, message: str) -> None:
+        """Asserts that main() called with argv exits with status 1 after printing message."""
+        with exit_catcher() as status:
+            run_main(*argv)
+        self.assertEqual(status.code, 1)
+        self.assertIn(message, self.stdout.getvalue())
+
+class TestCloneRunnerConfigFiles(CLITestCase):
+    """CLI tests going through the real config file loading."""
+
+    def test_missing_config_file(self):
         """Test that a missing config file triggers an error."""
-        with patch('sys.argv', ['clone_runner.py', 'non_existent.yaml']):
-            with self.assertRaises(SystemExit) as cm:
-                clone_runner.main()
-            self.assertEqual(cm.exception.code, 1)
-            self.assertIn("Error: Config file 'non_existent.yaml' not found.", mock_stdout.getvalue())
-
-    @patch('sys.stdout', new_callable=StringIO)
-    def test_malformed_yaml(self, mock_stdout: StringIO):
+        self.assertExitsWithError(('non_existent.yaml',), "Error: Config file 'non_existent.yaml' not found.")
+
+    def test_malformed_yaml(self):
         """Test that a malformed YAML file triggers an error."""
         malformed_yaml = "key: - value\n  - another_value: oops"  # bad indentation
 
-        with patch('sys.argv', ['clone_runner.py', 'malformed.yaml']):
-            # Mock is_file to return True, and open to return the malformed data
-            with patch('pathlib.Path.is_file', return_value=True):
-                with patch('pathlib.Path.open', unittest.mock.mock_open(read_data=malformed_yaml)):
-                    with self.assertRaises(SystemExit) as cm:
-                        clone_runner.main()
-
-                    self.assertEqual(cm.exception.code, 1)
-                    self.assertIn("Error parsing YAML file 'malformed.yaml'", mock_stdout.getvalue())
-
-    @patch('subprocess.run')
-    @patch('clone_runner.load_configs')
-    @patch('pathlib.Path.is_file')
-    @patch('sys.stdout', new_callable=StringIO)
-    def test_dry_run_flag(self, mock_stdout: StringIO, mock_is_file: MagicMock, mock_load_configs: MagicMock, mock_subprocess: MagicMock):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            config = Path(tmp_dir) / 'malformed.yaml'
+            config.write_text(malformed_yaml)
+            self.assertExitsWithError((str(config),), f"Error parsing YAML file '{config}'")
+
+    def test_config_path_not_regular_file(self):
+        """Test that a directory passed as config file is reported as not found."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            self.assertExitsWithError((tmp_dir,), f"Error: Config file '{tmp_dir}' not found.")
+
+    def test_config_path_unreachable(self):
+        """Test that a path below a regular file or through a symlink loop is reported as not found."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            (Path(tmp_dir) / 'afile').write_text("")
+            loop = Path(tmp_dir) / 'loop.yaml'
+            loop.symlink_to(loop)
+            for config in (Path(tmp_dir) / 'afile' / 'x.yaml', loop):
+                with self.subTest(config=config):
+                    self.assertExitsWithError((str(config),), f"Error: Config file '{config}' not found.")
+
+class TestCloneRunnerCLI(CLITestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Every CLI test gets its configs from load_configs and must never spawn a real process;
+        # the patchers are entered once for the class and the mocks reset before each test
+        cls.load_configs = cls.enterClassContext(patch('clone_runner.load_configs'))
+        cls.popen = cls.enterClassContext(patch('subprocess.Popen'))
+
+    def setUp(self):
+        super().setUp()
+        self.load_configs.reset_mock(return_value=True, side_effect=True)
+        self.popen.reset_mock(return_value=True, side_effect=True)
+
+    def test_dry_run_flag(self):
         """Test that the --dry-run flag prevents execution and prints dry-run message."""
-        mock_is_file.return_value = True
-        mock_load_configs.return_value = [{
+        self.load_configs.return_value = [{
             'jobs_to_clone': ['https://example.com/t1'],
             'variables': {'ARCH': 'x86_64'}
         }]
 
-        with patch('sys.argv', ['clone_runner.py', 'dummy.yaml', '--dry-run']):
-            clone_runner.main()
-
-        output = mock_stdout.getvalue()
-        self.assertIn("[DRY RUN] Would execute:", output)
-        self.assertIn("openqa-clone-job", output)
-        mock_subprocess.assert_not_called()
-
-    @patch('subprocess.run')
-    @patch('clone_runner.load_configs')
-    @patch('pathlib.Path.is_file')
-    @patch('sys.stdout', new_callable=StringIO)
-    def test_iso_post_dry_run(self, mock_stdout: StringIO, mock_is_file: MagicMock, mock_load_configs: MagicMock, mock_subprocess: MagicMock):
-        """Test that the ISO post mode respects the --dry-run flag."""
-        mock_is_file.return_value = True
-        # Configuration for ISO post mode (no jobs_to_clone, required vars present)
-        mock_load_configs.return_value = [{
-            'variables': {
-                'DISTRI': 'sle', 'VERSION': '15-SP5', 'FLAVOR': 'Online',
-                'ARCH': 'x86_64', '_GROUP_ID': 100, 'ISO': 'dummy.iso'
-            }
-        }]
+        with self.assertLogs('clone_runner', 'INFO') as cm:
+            run_main('dummy.yaml', '--dry-run')
 
-        with patch('sys.argv', ['clone_runner.py', 'iso_config.yaml', '--dry-run']):
-            clone_runner.main()
+        (command,) = dry_run_commands(cm.records)
+        self.assertEqual(command, ['openqa-clone-job', '--within-instance', 'https://example.com/t1', 'ARCH=x86_64'])
+        self.popen.assert_not_called()
 
-        output = mock_stdout.getvalue()
-        self.assertIn("[DRY RUN] Would execute:", output)
-        self.assertIn("openqa-cli api -X post isos", output)
-        mock_subprocess.assert_not_called()
-
-    @patch('subprocess.run')
-    @patch('clone_runner.load_configs')
-    @patch('pathlib.Path.is_file')
-    @patch('sys.stdout', new_callable=StringIO)
-    def test_iso_post_missing_iso(self, mock_stdout: StringIO, mock_is_file: MagicMock, mock_load_configs: MagicMock, mock_subprocess: MagicMock):
+    def test_iso_post_dry_run(self):
+        """Test that the ISO post mode respects the --dry-run flag and expands variables into the command."""
+        # Nested and circular expansion are covered directly in TestExpandVariables
+        cases = [
+            ({}, "ISO=dummy.iso"),
+            ({'ISO': 'SLE-%VERSION%-%FLAVOR%-%ARCH%.iso'}, "ISO=SLE-15-SP5-Online-x86_64.iso"),
+        ]
+        for extra_vars, expected_arg in cases:
+            with self.subTest(extra_vars=extra_vars):
+                self.load_configs.return_value = [{'variables': {**_BASE_ISO_VARS, **extra_vars}}]
+
+                with self.assertLogs('clone_runner', 'INFO') as cm:
+                    run_main('iso_config.yaml', '--dry-run')
+
+                (command,) = dry_run_commands(cm.records)
+                self.assertEqual(command[:5], ['openqa-cli', 'api', '-X', 'post', 'isos'])
+                self.assertIn(expected_arg, command)
+                self.assertFalse(any('%' in arg for arg in command))
+        self.popen.assert_not_called()
+
+    def test_iso_post_skips_expansion_without_references(self):
+        """Test that ISO post combinations are not expanded when no value contains a '%'."""
+        self.load_configs.return_value = [{'variables': {**_BASE_ISO_VARS, 'ARCH': ['x86_64', 'aarch64']}}]
+        with patch('clone_runner.expand_variables') as mock_expand, self.assertLogs('clone_runner', 'INFO') as cm:
+            run_main('iso_config.yaml', '--dry-run')
+        mock_expand.assert_not_called()
+        self.assertEqual([command[-1] for command in dry_run_commands(cm.records)], ['ARCH=x86_64', 'ARCH=aarch64'])
+
+    def test_iso_post_reports_response(self):
+        """Test that the openQA response, including templates that failed to schedule, is reported."""
+        self.load_configs.return_value = [{'variables': dict(_BASE_ISO_VARS)}]
+        fake_process(self.popen, b'{"ids": [7], "failed": [{"job_name": "foo", "error_messages": ["bad"]}]}')
+        self.enterContext(patch('pathlib.Path.write_bytes', autospec=True))
+
+        run_main('iso_config.yaml')
+
+        output = self.stdout.getvalue()
+        self.assertIn('   Response: {"ids": [7], "failed": [{"job_name": "foo", "error_messages": ["bad"]}]}', output)
+        self.assertIn('   Warning: 1 job(s) could not be scheduled: [{"job_name": "foo", "error_messages": ["bad"]}]', output)
+        self.assertIn("   Extracted 1 new job IDs.", output)
+
+    def test_iso_post_missing_iso(self):
         """Test that missing ISO variable triggers an error in ISO post mode."""
-        mock_is_file.return_value = True
-        mock_load_configs.return_value = [{
-            'variables': {
-                'DISTRI': 'sle', 'VERSION': '15-SP5', 'FLAVOR': 'Online',
-                'ARCH': 'x86_64', '_GROUP_ID': 100
-            }
-        }]
-
-        with patch('sys.argv', ['clone_runner.py', 'iso_config.yaml']):
-            with self.assertRaises(SystemExit) as cm:
-                clone_runner.main()
-
-            self.assertEqual(cm.exception.code, 1)
-            self.assertIn("Error: Missing required variables for ISO post: ISO", mock_stdout.getvalue())
-
-    @patch('subprocess.run')
-    @patch('clone_runner.load_configs')
-    @patch('pathlib.Path.is_file')
-    @patch('sys.stdout', new_callable=StringIO)
-    def test_iso_post_variable_expansion(self, mock_stdout: StringIO, mock_is_file: MagicMock, mock_load_configs: MagicMock, mock_subprocess: MagicMock):
-        """Test that variable expansion works correctly in ISO post mode."""
-        mock_is_file.return_value = True
-        mock_load_configs.return_value = [{
-            'variables': {
-                'DISTRI': 'sle', 'VERSION': '15-SP5', 'FLAVOR': 'Online',
-                'ARCH': 'x86_64', '_GROUP_ID': 100,
-                'ISO': 'SLE-%VERSION%-%FLAVOR%-%ARCH%.iso'
-            }
-        }]
+        self.load_configs.return_value = [{'variables': {k: v for k, v in _BASE_ISO_VARS.items() if k != 'ISO'}}]
 
-        with patch('sys.argv', ['clone_runner.py', 'iso_config.yaml', '--dry-run']):
-            clone_runner.main()
+        self.assertExitsWithError(('iso_config.yaml',), "Error: Missing required variables for ISO post: ISO")
 
-        output = mock_stdout.getvalue()
-        self.assertIn("[DRY RUN] Would execute:", output)
-        self.assertIn("ISO=SLE-15-SP5-Online-x86_64.iso", output)
-        self.assertNotIn("%VERSION%", output)
-        mock_subprocess.assert_not_called()
-
-    @patch('subprocess.run')
-    @patch('clone_runner.load_configs')
-    @patch('pathlib.Path.is_file')
-    @patch('sys.stdout', new_callable=StringIO)
-    def test_nested_variable_expansion(self, mock_stdout: StringIO, mock_is_file: MagicMock, mock_load_configs: MagicMock, mock_subprocess: MagicMock):
-        """Test that nested variable expansion works correctly (e.g. A->B->C)."""
-        mock_is_file.return_value = True
-        mock_load_configs.return_value = [{
-            'variables': {
-                'DISTRI': 'sle', 'VERSION': '15-SP5', 'FLAVOR': 'Online',
-                'ARCH': 'x86_64', '_GROUP_ID': 100,
-                'ISO': 'dummy.iso',
-                'PART1': 'Start',
-                'PART2': '%PART1%-Middle',
-                'FULL': '%PART2%-End'
-            }
+    def test_conflicting_host_and_flag(self):
+        """Test that conflicting host config and flags trigger an error."""
+        self.load_configs.return_value = [{
+            'host': 'https://openqa.opensuse.org',
+            'variables': _BASE_ISO_VARS,
+            'flags': ['--osd']
         }]
 
-        with patch('sys.argv', ['clone_runner.py', 'iso_config.yaml', '--dry-run']):
-            clone_runner.main()
-
-        output = mock_stdout.getvalue()
-        self.assertIn("FULL=Start-Middle-End", output)
-
-    @patch('subprocess.run')
-    @patch('clone_runner.load_configs')
-    @patch('pathlib.Path.is_file')
-    @patch('sys.stdout', new_callable=StringIO)
-    def test_circular_dependency(self, mock_stdout: StringIO, mock_is_file: MagicMock, mock_load_configs: MagicMock, mock_subprocess: MagicMock):
-        """Test that circular dependencies (A->B->A) are handled gracefully (no infinite loop)."""
-        mock_is_file.return_value = True
-        mock_load_configs.return_value = [{
-            'variables': {
-                'DISTRI': 'sle', 'VERSION': '15-SP5', 'FLAVOR': 'Online',
-                'ARCH': 'x86_64', '_GROUP_ID': 100,
-                'ISO': 'dummy.iso',
-                'VAR_A': '%VAR_B%',
-                'VAR_B': '%VAR_A%'
-            }
-        }]
+        self.assertExitsWithError(('conflict.yaml', '--dry-run'), "Error: Conflicting options: 'host' set to 'https://openqa.opensuse.org' but '--osd' flag provided.")
 
-        with patch('sys.argv', ['clone_runner.py', 'iso_config.yaml', '--dry-run']):
-            clone_runner.main()
+    def test_clone_output_shown_per_job(self):
+        """Test that openqa-clone-job's output is shown below the job it belongs to."""
+        self.load_configs.return_value = [{'jobs_to_clone': ['https://example.com/t1', 'https://example.com/t2'],
+                                           'variables': {}}]
+        fake_process(self.popen, b"Cloning parents of foo\n - foo -> https://new/job\n")
+        self.enterContext(patch('pathlib.Path.write_bytes', autospec=True))
 
-        output = mock_stdout.getvalue()
-        self.assertIn("[DRY RUN] Would execute:", output)
-        # Ensure variables are present in output even if not fully resolved
-        self.assertIn("VAR_A=", output)
-        self.assertIn("VAR_B=", output)
+        run_main('clone.yaml')
 
-    @patch('subprocess.run')
-    @patch('clone_runner.load_configs')
-    @patch('pathlib.Path.is_file')
-    @patch('sys.stdout', new_callable=StringIO)
-    def test_conflicting_host_and_flag(self, mock_stdout: StringIO, mock_is_file: MagicMock, mock_load_configs: MagicMock, mock_subprocess: MagicMock):
-        """Test that conflicting host config and flags trigger an error."""
-        mock_is_file.return_value = True
-        mock_load_configs.return_value = [{
-            'host': 'https://openqa.opensuse.org',
-            'variables': {'DISTRI': 'sle', 'VERSION': '15', 'FLAVOR': 'Online', 'ARCH': 'x86_64', '_GROUP_ID': 100, 'ISO': 'dummy.iso'},
-            'flags': ['--osd']
-        }]
+        job_output = "Cloning parents of foo\n - foo -> https://new/job\n\n   Extracted 1 new job URLs.\n"
+        output = self.stdout.getvalue()
+        self.assertIn(f"Processing: https://example.com/t1\n{job_output}", output)
+        self.assertIn(f"Processing: https://example.com/t2\n{job_output}", output)
 
-        with patch('sys.argv', ['clone_runner.py', 'conflict.yaml', '--dry-run']):
-            with self.assertRaises(SystemExit) as cm:
-                clone_runner.main()
-
-            self.assertEqual(cm.exception.code, 1)
-            self.assertIn("Error: Conflicting options: 'host' set to 'https://openqa.opensuse.org' but '--osd' flag provided.", mock_stdout.getvalue())
-
-    @patch('sys.stdout', new_callable=StringIO)
-    def test_duplicate_keys_yaml(self, mock_stdout: StringIO):
-        """Test that duplicate keys in YAML trigger an error."""
-        duplicate_yaml = "variables:\n  ARCH: x86_64\n  ARCH: i586"
-
-        with patch('sys.argv', ['clone_runner.py', 'duplicate.yaml']):
-            with patch('pathlib.Path.is_file', return_value=True):
-                with patch('pathlib.Path.open', unittest.mock.mock_open(read_data=duplicate_yaml)):
-                    with self.assertRaises(SystemExit) as cm:
-                        clone_runner.main()
-                    self.assertEqual(cm.exception.code, 1)
-                    self.assertIn("Duplicate key 'ARCH' found in YAML", mock_stdout.getvalue())
-
-    @patch('subprocess.run')
-    @patch('clone_runner.load_configs')
-    @patch('pathlib.Path.is_file')
-    @patch('sys.stdout', new_callable=StringIO)
-    def test_multiple_configs_separate_outputs(self, mock_stdout: StringIO, mock_is_file: MagicMock, mock_load_configs: MagicMock, mock_subprocess: MagicMock):
+    def test_multiple_configs_separate_outputs(self):
         """Test that multiple config files produce separate output files."""
-        mock_is_file.return_value = True
-        mock_load_configs.side_effect = [
+        self.load_configs.side_effect = [
             [{'jobs_to_clone': ['https://example.com/t1'], 'variables': {}}],
             [{'jobs_to_clone': ['https://example.com/t2'], 'variables': {}}]
         ]
 
         # Mock subprocess to return output containing a URL
-        mock_subprocess.return_value.stdout = "-> https://new/job"
+        fake_process(self.popen, b"-> https://new/job\n")
 
-        mock_file = unittest.mock.mock_open()
+        write_bytes = self.enterContext(patch('pathlib.Path.write_bytes', autospec=True))
 
-        with patch('sys.argv', ['clone_runner.py', 'config1.yaml', 'config2.yaml']):
-            with patch('pathlib.Path.open', mock_file):
-                clone_runner.main()
+        run_main('config1.yaml', 'config2.yaml')
 
-        self.assertEqual(mock_load_configs.call_count, 2)
+        self.assertEqual(self.load_configs.call_count, 2)
 
-        # Verify that open was called twice with different filenames
-        # mock_file is the mock for Path.open. When called, the first arg is the Path instance (self).
-        open_calls = mock_file.call_args_list
-        self.assertEqual(len(open_calls), 2)
+        # autospec passes the Path instance as the first argument
+        self.assertEqual([call.args for call in write_bytes.call_args_list],
+                         [(Path('config1.urls.txt'), b"https://new/job\n"),
+                          (Path('config2.urls.txt'), b"https://new/job\n")])
 
-        self.assertIn("Success! 1 URLs saved to 'config1.urls.txt'", mock_stdout.getvalue())
-        self.assertIn("Success! 1 URLs saved to 'config2.urls.txt'", mock_stdout.getvalue())
+        self.assertEqual(SUCCESS_RE.findall(self.stdout.getvalue()), [('1', 'config1.urls.txt'), ('1', 'config2.urls.txt')])
 
-    @patch('clone_runner.run_clone_jobs')
-    @patch('clone_runner.load_configs')
-    @patch('pathlib.Path.is_file')
-    @patch('sys.stdout', new_callable=StringIO)
-    def test_multidoc_isolation(self, mock_stdout: StringIO, mock_is_file: MagicMock, mock_load_configs: MagicMock, mock_run_clone):
+    def test_duplicate_urls_written_once(self):
+        """Test that a URL reported by several documents is written to the output file only once."""
+        mock_run_clone = self.enterContext(patch('clone_runner.run_clone_jobs'))
+        self.load_configs.return_value = [
+            {'jobs_to_clone': ['j1'], 'variables': {}},
+            {'jobs_to_clone': ['j2'], 'variables': {}}
+        ]
+        mock_run_clone.side_effect = [['https://new/t1', 'https://new/t2'], ['https://new/t2', 'https://new/t3']]
+        write_bytes = self.enterContext(patch('pathlib.Path.write_bytes', autospec=True))
+
+        run_main('dups.yaml')
+
+        write_bytes.assert_called_once_with(Path('dups.urls.txt'), b"https://new/t1\nhttps://new/t2\nhttps://new/t3\n")
+        self.assertEqual(SUCCESS_RE.findall(self.stdout.getvalue()), [('3', 'dups.urls.txt')])
+
+    def test_multidoc_isolation(self):
         """Test that variables do not leak between documents in the same file."""
-        mock_is_file.return_value = True
-        mock_load_configs.return_value = [
+        mock_run_clone = self.enterContext(patch('clone_runner.run_clone_jobs'))
+        self.load_configs.return_value = [
             {'jobs_to_clone': ['j1'], 'variables': {'A': '1'}},
             {'jobs_to_clone': ['j2'], 'variables': {'B': '2'}}
         ]
         mock_run_clone.return_value = []
 
-        with patch('sys.argv', ['clone_runner.py', 'multidoc.yaml']):
-            clone_runner.main()
+        run_main('multidoc.yaml')
 
         args1 = mock_run_clone.call_args_list[0]
         args2 = mock_run_clone.call_args_list[1]
@@ -358,24 +658,18 @@ class TestCloneRunnerCLI(unittest.TestCase):
         self.assertIn('B', vars2)
         self.assertNotIn('A', vars2)
 
-    @patch('clone_runner.run_clone_jobs')
-    @patch('clone_runner.load_configs')
-    @patch('pathlib.Path.is_file')
-    @patch('sys.stdout', new_callable=StringIO)
-    def test_multiple_files_variable_isolation(self, mock_stdout: StringIO, mock_is_file: MagicMock, mock_load_configs: MagicMock, mock_run_clone):
+    def test_multiple_files_variable_isolation(self):
         """Test that variables do not leak between different configuration files."""
-        mock_is_file.return_value = True
-
+        mock_run_clone = self.enterContext(patch('clone_runner.run_clone_jobs'))
         # Setup mock to return different configs for sequential calls
-        mock_load_configs.side_effect = [
+        self.load_configs.side_effect = [
             [{'jobs_to_clone': ['j1'], 'variables': {'VAR_FILE1': '1'}}],
             [{'jobs_to_clone': ['j2'], 'variables': {'VAR_FILE2': '2'}}]
         ]
 
         mock_run_clone.return_value = []
 
-        with patch('sys.argv', ['clone_runner.py', 'file1.yaml', 'file2.yaml']):
-            clone_runner.main()
+        run_main('file1.yaml', 'file2.yaml')
 
         self.assertEqual(mock_run_clone.call_count, 2)
 
@@ -389,47 +683,29 @@ class TestCloneRunnerCLI(unittest.TestCase):
         self.assertIn('VAR_FILE2', vars2)
         self.assertNotIn('VAR_FILE1', vars2)
 
-    @patch('subprocess.run')
-    @patch('clone_runner.load_configs')
-    @patch('pathlib.Path.is_file')
-    @patch('sys.stdout', new_callable=StringIO)
-    def test_multiple_configs_one_missing(self, mock_stdout: StringIO, mock_is_file: MagicMock, mock_load_configs: MagicMock, mock_subprocess: MagicMock):
+    def test_multiple_configs_one_missing(self):
         """Test that if one of multiple config files is missing, execution stops with error."""
-        mock_subprocess.return_value.stdout = ""
+        fake_process(self.popen)
         # First file exists, second does not
-        mock_is_file.side_effect = [True, False]
-
-        # load_configs called only for the existing file
-        mock_load_configs.return_value = [{'jobs_to_clone': ['j1'], 'variables': {}}]
-
-        with patch('sys.argv', ['clone_runner.py', 'exist.yaml', 'missing.yaml']):
-            with self.assertRaises(SystemExit) as cm:
-                clone_runner.main()
+        self.load_configs.side_effect = [
+            [{'jobs_to_clone': ['j1'], 'variables': {}}],
+            FileNotFoundError("missing.yaml")
+        ]
 
-            self.assertEqual(cm.exception.code, 1)
-            self.assertIn("Error: Config file 'missing.yaml' not found.", mock_stdout.getvalue())
+        self.assertExitsWithError(('exist.yaml', 'missing.yaml'), "Error: Config file 'missing.yaml' not found.")
 
-    @patch('subprocess.run')
-    @patch('clone_runner.load_configs')
-    @patch('pathlib.Path.is_file')
-    @patch('sys.stdout', new_callable=StringIO)
-    def test_multiple_configs_one_invalid(self, mock_stdout: StringIO, mock_is_file: MagicMock, mock_load_configs: MagicMock, mock_subprocess: MagicMock):
+    def test_multiple_configs_one_invalid(self):
         """Test that if one of multiple config files is invalid, execution stops with error."""
-        mock_subprocess.return_value.stdout = ""
-        mock_is_file.return_value = True
-
+        fake_process(self.popen)
         # First call succeeds, second raises ValueError
-        mock_load_configs.side_effect = [
+        self.load_configs.side_effect = [
             [{'jobs_to_clone': ['j1'], 'variables': {}}],
             ValueError("Invalid YAML")
         ]
 
-        with patch('sys.argv', ['clone_runner.py', 'valid.yaml', 'invalid.yaml']):
-            with self.assertRaises(SystemExit) as cm:
-                clone_runner.main()
-
-            self.assertEqual(cm.exception.code, 1)
-            self.assertIn("Invalid YAML", mock_stdout.getvalue())
+        self.assertExitsWithError(('valid.yaml', 'invalid.yaml'), "Invalid YAML")
 
 if __name__ == '__main__':
+    # The tests are independent; run them in the order they are defined instead of sorting them by name
+    unittest.TestLoader.sortTestMethodsUsing = None
     unittest.main()